@@ -1,5 +1,11 @@
 import unicodedata
 
+try:
+    import numpy as np
+except ImportError as err:
+    print(err, "尝试运行 `python -m pip install -r requirements.txt`")
+    exit()
+
 def generate_enhanced_unicode(output_file="enhanced_unicode.txt"):
     """生成增强版Unicode字符集，包含多语言支持和专业符号"""
     
@@ -74,44 +80,51 @@ def generate_enhanced_unicode(output_file="enhanced_unicode.txt"):
     confusing_chars = {
     }
 
-    with open(output_file, "w", encoding="utf-8", errors="replace") as f:
-        # 使用生成器优化内存
-        def char_generator():
-            for start, end in included_ranges:
-                
-                for cp in range(start, end + 1):
-                    # 基础排除检查
-                    if any(low <= cp <= high for (low, high) in excluded_ranges):
-                        continue
-                    if cp in confusing_chars:
-                        continue
-                    if (cp & 0xFFFE) == 0xFFFE:  # 非字符码点
-                        continue
+    # 拼接全部候选码点，并用排除掩码一次性过滤
+    cps = np.concatenate(
+        [np.arange(start, end + 1, dtype=np.uint32) for start, end in included_ranges]
+    )
+    excluded = np.zeros(0x110000, dtype=bool)
+    for low, high in excluded_ranges:
+        excluded[low : high + 1] = True
+    for cp in confusing_chars:
+        excluded[cp] = True
+    cps = cps[~excluded[cps]]
+    cps = cps[(cps & 0xFFFE) != 0xFFFE]  # 非字符码点
+
+    category = unicodedata.category
+    combining = unicodedata.combining
+    bidirectional = unicodedata.bidirectional
 
-                    try:
-                        char = chr(cp)
-                        # 使用unicodedata过滤未分配字符
-                        if unicodedata.category(char) == 'Cn':
-                            continue
-                        # 过滤组合字符和不可见字符
-                        if unicodedata.combining(char) > 0:
-                            continue
-                        if unicodedata.bidirectional(char) in ('BN', 'B'):
-                            continue
-                            
+    # 只对剩余码点调用unicodedata
+    def char_generator():
+        for cp in cps.tolist():
+            # 可打印ASCII必然有效，无需查询unicodedata
+            if 0x20 <= cp < 0x7F:
+                yield chr(cp)
+                continue
+            try:
+                char = chr(cp)
+                # 中日韩统一表意文字均为非组合、左到右字符，只需检查是否已分配
+                if 0x4E00 <= cp <= 0x9FFF:
+                    if category(char) != 'Cn':
                         yield char
-                    except Exception as e:
-                        print(f"跳过无效码点 U+{cp:04X}: {str(e)}")
+                    continue
+                # 使用unicodedata过滤未分配字符
+                if category(char) == 'Cn':
+                    continue
+                # 过滤组合字符和不可见字符
+                if combining(char) > 0:
+                    continue
+                if bidirectional(char) in ('BN', 'B'):
+                    continue
 
-        # 分批写入文件
-        buffer = []
-        for char in char_generator():
-            buffer.append(char)
-            if len(buffer) >= 10000:  # 每1万个字符写入一次
-                f.write(''.join(buffer))
-                buffer = []
-        if buffer:  # 写入剩余内容
-            f.write(''.join(buffer))
+                yield char
+            except Exception as e:
+                print(f"跳过无效码点 U+{cp:04X}: {str(e)}")
+
+    with open(output_file, "w", encoding="utf-8", errors="replace") as f:
+        f.write(''.join(char_generator()))
 
 if __name__ == "__main__":
     generate_enhanced_unicode()
@@ -1,8 +1,8 @@
-import sys
 import struct
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm
-from collections import defaultdict
 
 try:
     import numpy as np
@@ -11,7 +11,7 @@ except ImportError as err:
     print(err, "尝试运行 `python -m pip install -r requirements.txt`")
     exit()
 
-__version__ = "1.2"  # 版本更新为支持大哈希表
+__version__ = "1.4"  # 哈希槽偏移高8位存放盐值
 
 # --- 优化的 BMF 文件结构 ---
 """
@@ -26,73 +26,102 @@ __version__ = "1.2"  # 版本更新为支持大哈希表
 """
 
 
-def get_im(word, width, height, font, offset: tuple = (0, 0)) -> Image.Image:
-    im = Image.new("1", (width, height), (1,))
+BATCH_SIZE = 256  # 每张画布渲染的字符数
+_ENTRY = struct.Struct("<HI")  # 哈希槽: Unicode码 + 盐值|位图偏移
+
+
+_worker_font = None  # 渲染进程内的字体对象
+
+
+def _init_worker(font_file, font_size: int):
+    """每个渲染进程只加载一次字体"""
+    global _worker_font
+    _worker_font = ImageFont.truetype(font=font_file, size=font_size)
+
+
+def _render_batch(batch, font_size: int, offset=(0, 0)) -> np.ndarray:
+    """在一张画布上渲染一批字符，返回形状为 (字符数, 字号, 字号) 的点阵数组"""
+    # 每个字符四周留出一个字号的空白，避免溢出的笔画画进相邻字符
+    pad = font_size
+    cell = font_size + 2 * pad
+    im = Image.new("1", (cell, cell * len(batch)), (0,))
     draw = ImageDraw.Draw(im)
-    draw.text(offset, word, font=font)
-    return im
-
-
-def is_empty_image(image: Image.Image) -> bool:
-    """检查图像是否为空（即没有任何像素被绘制）"""
-    return np.all(np.array(image) == 1)
-
-
-def to_bitmap(word: str, font_size: int, font, offset=(0, 0)) -> bytearray:
-    """获取点阵字节数据"""
-    code = 0x00
-    data_code = word.encode("utf-8")
-
-    # 获取字节码
-    try:
-        for byte in range(len(data_code)):
-            code |= data_code[byte] << (len(data_code) - byte - 1) * 8
-    except IndexError:
-        print(word, word.encode("utf-8"))
-
-    # 获取点阵图
-    bp = np.pad(
-        (
-            ~np.asarray(
-                get_im(
-                    word, width=font_size, height=font_size, font=font, offset=offset
-                )
-            )
-        ).astype(np.int32),
-        ((0, 0), (0, int(np.ceil(font_size / 8) * 8 - font_size))),
-        "constant",
-        constant_values=(0, 0),
-    )
-    if word == "a":
-        print(bp)
+    for k, word in enumerate(batch):
+        draw.text(
+            (pad + offset[0], k * cell + pad + offset[1]),
+            word,
+            font=_worker_font,
+            fill=1,
+        )
+    cells = np.asarray(im).reshape(len(batch), cell, cell)
+    return cells[:, pad : pad + font_size, pad : pad + font_size].astype(np.uint8)
+
+
+def render_glyphs(
+    words, font_size: int, font_file, offset=(0, 0), max_workers=None
+) -> np.ndarray:
+    """多进程批量渲染字符，返回形状为 (字符数, 字号, 字号) 的点阵数组"""
+    if not words:
+        return np.zeros((0, font_size, font_size), dtype=np.uint8)
+
+    batches = [words[i : i + BATCH_SIZE] for i in range(0, len(words), BATCH_SIZE)]
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(font_file, font_size),
+    ) as executor:
+        results = executor.map(
+            partial(_render_batch, font_size=font_size, offset=offset), batches
+        )
+        return np.concatenate(list(tqdm(results, total=len(batches), desc="渲染字符")))
+
 
-    # 点阵映射 MONO_HLSB
-    bmf = []
-    for line in bp.reshape((-1, 8)):
-        v = 0x00
-        for _ in line:
-            v = (v << 1) + _
-        bmf.append(v)
-    return bytearray(bmf)
+def to_bitmap(glyphs: np.ndarray) -> bytes:
+    """将点阵数组映射为 MONO_HLSB 字节数据"""
+    return np.packbits(glyphs, axis=2, bitorder="big").tobytes()
 
 
-def generate_hash_table(words, start_bitmap, bytes_per_char):
+def hash_salt(unicode: int) -> int:
+    """计算哈希槽盐值 (乘法散列的高位)，用于查找时提前排除不匹配的槽"""
+    return (unicode * 2654435761) >> 24 & 0xFF
+
+
+def generate_hash_table(codes, start_bitmap, bytes_per_char):
     """生成哈希表 (开放寻址法)"""
-    table_size = max(2 * len(words), 256)  # 允许超过65535
-    hash_table = bytearray(table_size * 6)
+    if start_bitmap + len(codes) * bytes_per_char > 0xFFFFFF:
+        raise ValueError("位图数据超过24位偏移范围 (16MB)")
+
+    # 槽数取2的幂 (至少512)，用位掩码代替取模；允许超过65535
+    table_size = 1 << max(9, (2 * len(codes) - 1).bit_length())
+    mask = table_size - 1
+    # 每槽6字节紧凑排列: Unicode码 (<H) + 盐值(高8位)|位图偏移(低24位) (<I)
+    table = np.zeros(
+        table_size, dtype=np.dtype([("u", "<u2"), ("off", "<u4")], align=False)
+    )
+    table_u = table["u"]
+    table_off = table["off"]
 
-    for idx, word in tqdm(enumerate(words), desc="创建哈希表"):
-        unicode = ord(word)
-        slot = unicode % table_size
+    for idx, unicode in tqdm(enumerate(codes.tolist()), desc="创建哈希表"):
+        slot = unicode & mask
 
-        while hash_table[slot * 6 : slot * 6 + 2] != b"\x00\x00":
-            slot = (slot + 1) % table_size
+        # 三角数二次探测，在2的幂大小的表上保证遍历所有槽
+        i = 1
+        while table_u[slot]:
+            slot = (slot + i) & mask
+            i += 1
 
+        table_u[slot] = unicode
         offset = start_bitmap + idx * bytes_per_char
-        hash_table[slot * 6 : slot * 6 + 2] = struct.pack("<H", unicode)
-        hash_table[slot * 6 + 2 : slot * 6 + 6] = struct.pack("<I", offset)
+        table_off[slot] = offset | hash_salt(unicode) << 24
 
-    return hash_table
+    return table.tobytes()
+
+
+def iter_chars(text_file, chunk_size=1 << 20):
+    """分块读取文本文件并产出字符，避免一次性读入整个文件 (块内已去重)"""
+    with open(text_file, "r", encoding="utf-8") as f:
+        while chunk := f.read(chunk_size):
+            yield from dict.fromkeys(chunk)
 
 
 def run(
@@ -103,65 +132,47 @@ def run(
     text=None,
     bitmap_fonts_name=None,
 ):
-    font = ImageFont.truetype(font=font_file, size=font_size)
-
-    if text:
-        words = list(set(text))
-    else:
-        with open(text_file, "r", encoding="utf-8") as f:
-            words = list(set(f.read()))
-    words.sort()
+    # 去重后按码点排序
+    words = sorted(dict.fromkeys(text or iter_chars(text_file)))
+    codes = np.fromiter(map(ord, words), dtype="<u2", count=len(words))
 
     # 过滤掉渲染为空的字符
-    filtered_words = []
-    for word in tqdm(words, desc="过滤空字符"):
-        image = get_im(
-            word, width=font_size, height=font_size, font=font, offset=offset
-        )
-        if not is_empty_image(image) or word == " ":
-            filtered_words.append(word)
-        # else:
-        # print(word, '为空')
-    words = filtered_words
-    font_num = len(words)
+    glyphs = render_glyphs(words, font_size, font_file, offset)
+    keep = glyphs.any(axis=(1, 2)) | (codes == ord(" "))
+    codes = codes[keep]
+    glyphs = glyphs[keep]
+    font_num = len(codes)
 
     bytes_per_char = int(np.ceil(font_size / 8)) * font_size
     bitmap_fonts_name = (
         bitmap_fonts_name or f"{font_file.split('.')[0]}-{font_num}-{font_size}.bmf"
     )
 
-    with open(bitmap_fonts_name, "wb") as f:
+    # 各段偏移均可预先算出，文件头一次写好，无需回填
+    start_bitmap = 24 + codes.nbytes
+    hash_start = start_bitmap + font_num * bytes_per_char
+    hash_table = generate_hash_table(codes, start_bitmap, bytes_per_char)
+    hash_slots = len(hash_table) // 6
+
+    with open(bitmap_fonts_name, "wb", buffering=1 << 20) as f:
         print(f"生成点阵字体 (v{__version__})，字符数: {font_num}")
 
         header = bytearray(24)
         header[0:3] = bytes([0x0B, 0x2D, 0x0E])
+        header[3:6] = start_bitmap.to_bytes(3, byteorder="little")
         header[6] = font_size
         header[7] = bytes_per_char
+        header[8:11] = hash_start.to_bytes(3, byteorder="little")
+        header[11:14] = hash_slots.to_bytes(3, byteorder="little")
         f.write(header)
 
-        unicode_data = bytearray()
-        for w in tqdm(words, desc="生成Unicode表"):
-            unicode_data += struct.pack("<H", ord(w))
-        f.write(unicode_data)
+        f.write(codes.tobytes())
 
-        start_bitmap = f.tell()
         print(f"位图起始: 0x{start_bitmap:X}")
+        f.write(to_bitmap(glyphs))
 
-        for w in tqdm(words, desc="生成位图"):
-            f.write(to_bitmap(w, font_size, font, offset))
-
-        hash_table = generate_hash_table(words, start_bitmap, bytes_per_char)
-        hash_start = f.tell()
         f.write(hash_table)
 
-        f.seek(3)
-        f.write(start_bitmap.to_bytes(3, byteorder="little"))
-
-        f.seek(8)
-        f.write(hash_start.to_bytes(3, byteorder="little"))
-        hash_slots = len(hash_table) // 6
-        f.write(hash_slots.to_bytes(3, byteorder="little"))
-
         print(f"生成完成: {bitmap_fonts_name} (总大小: {f.tell()/1024:.2f}KB)")
         return bitmap_fonts_name
 
@@ -174,21 +185,29 @@ class BMFParser:
         self.hash_start = int.from_bytes(data[8:11], "little")
         self.hash_slots = int.from_bytes(data[11:14], "little")
         self.data = data
+        self._view = memoryview(data)
 
     def get_char(self, unicode):
-        slot = unicode % self.hash_slots
+        view = self._view
+        hash_start = self.hash_start
+        mask = self.hash_slots - 1
+        salt = hash_salt(unicode)
+        slot = unicode & mask
+        i = 1
         while True:
-            entry = self.data[
-                self.hash_start + slot * 6 : self.hash_start + slot * 6 + 6
-            ]
-            entry_unicode = struct.unpack("<H", entry[0:2])[0]
-            entry_offset = struct.unpack("<I", entry[2:6])[0]
+            entry_unicode, entry_offset = _ENTRY.unpack_from(
+                view, hash_start + slot * 6
+            )
 
-            if entry_unicode == unicode:
-                return self.data[entry_offset : entry_offset + self.bytes_per_char]
-            elif entry_unicode == 0:
+            # 空槽的偏移为0 (位图不可能从文件头开始)
+            if entry_offset == 0:
                 return None
-            slot = (slot + 1) % self.hash_slots
+            # 盐值不同必然不是目标字符，无需比较Unicode码
+            if entry_offset >> 24 == salt and entry_unicode == unicode:
+                entry_offset &= 0xFFFFFF
+                return self.data[entry_offset : entry_offset + self.bytes_per_char]
+            slot = (slot + i) & mask
+            i += 1
 
     def render_to_console(self, unicode, foreground="█", background=" "):
         """
@@ -203,18 +222,11 @@ class BMFParser:
             print(f"字符U+{unicode:04X}不存在")
             return
 
-        bytes_per_line = int(np.ceil(self.font_size / 8))
-        for y in range(self.font_size):
-            line_byte = char_data[y * bytes_per_line : (y + 1) * bytes_per_line]
-            bits = []
-            for byte in line_byte:
-                bits.extend([(byte >> i) & 1 for i in range(7, -1, -1)])
-
-            # 只取字体宽度的部分
-            line = "".join(
-                [foreground if bit else background for bit in bits[: self.font_size]]
-            )
-            print(line)
+        bits = np.unpackbits(np.frombuffer(char_data, dtype=np.uint8))
+        # 只取字体宽度的部分
+        bits = bits.reshape(self.font_size, -1)[:, : self.font_size]
+        pixels = np.where(bits, foreground, background)
+        print("\n".join("".join(row) for row in pixels))
 
     def print_char(self, char, foreground="█", background=" "):
         """